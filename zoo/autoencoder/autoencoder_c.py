@@ -52,7 +52,7 @@ class AutoEncoder(Composable):
         inputs = Input(input_shape)
         encoder = self.encoder(inputs, layers=layers)
         outputs = self.decoder(encoder, layers=layers)
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def encoder(self, x, **metaparameters):
         ''' Construct the Encoder 
@@ -95,13 +95,13 @@ class AutoEncoder(Composable):
 
     def compile(self, optimizer='adam'):
         ''' Compile the model using Mean Square Error loss '''
-        self._model.compile(loss='mse', optimizer=optimizer, metrics=['accuracy'])
+        self.model.compile(loss='mse', optimizer=optimizer, metrics=['accuracy'])
 
     def extract(self):
         ''' Extract the pretrained encoder
         '''
         # Get the trained weights from the autoencoder
-        weights = self._model.get_weights()
+        weights = self.model.get_weights()
 
         # Extract out the weights for just the encoder  (6 sets per layer)
         encoder_weights = weights[0 : int((6 * len(self.layers)))]
@@ -82,7 +82,7 @@ class DenseNet(Composable):
             outputs = self.classifier(outputs, n_classes, dropout=0.1)
 
         # Instantiate the model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def stem(self, inputs, n_filters):
         """ Construct the Stem Convolution Group
@@ -59,7 +59,7 @@ class InceptionV3(Composable):
             outputs = self.classifier(outputs, n_classes, dropout)
 
         # Instantiate the Model
-        self._model = Model(inputs, [outputs] + aux)
+        self.model = Model(inputs, [outputs] + aux)
 
     def stem(self, inputs):
         """ Construct the Stem Convolutional Group 
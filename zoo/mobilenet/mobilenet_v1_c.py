@@ -75,7 +75,7 @@ class MobileNetV1(Composable):
             outputs = self.classifier(outputs, n_classes, alpha=alpha, dropout=dropout)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
     
     def stem(self, inputs, **metaparameters):
         """ Construct the Stem Group
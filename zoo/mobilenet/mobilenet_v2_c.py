@@ -76,7 +76,7 @@ class MobileNetV2(Composable):
             outputs = self.classifier(outputs, n_classes, dropout=0.0)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def stem(self, inputs, **metaparameters):
         """ Construct the Stem Group
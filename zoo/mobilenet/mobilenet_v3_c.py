@@ -107,7 +107,7 @@ class MobileNetV3(Composable):
             outputs = self.classifier(outputs, n_classes)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def stem(self, inputs, **metaparameters):
         """ Construct the Stem Group
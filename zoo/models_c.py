@@ -65,15 +65,8 @@ class Composable(object):
         # Post-activation conditional probabilities for classifier
         self._softmax = None
 
-        self._model = None
-
-    @property
-    def model(self):
-        return self._model
-
-    @model.setter
-    def model(self, _model):
-        self._model = _model
+        # The underlying tf.keras model
+        self.model = None
 
     @property
     def encoding(self):
@@ -169,7 +162,8 @@ class Composable(object):
       
       # Save the pre-activation probabilities layer
       self.probabilities = x
-      outputs = Activation('softmax')(x)
+      # Keep the softmax in float32 for numerical stability under mixed precision
+      outputs = Activation('softmax', dtype='float32')(x)
       # Save the post-activation probabilities layer
       self.softmax = outputs
       return outputs
@@ -178,13 +172,13 @@ class Composable(object):
         """ Add layer to the top of the neural network
             layer : layer to add
         """
-        outputs = layer(self._model.outputs)
-        self._model = Model(self._model.inputs, outputs)
+        outputs = layer(self.model.outputs)
+        self.model = Model(self.model.inputs, outputs)
 
     def summary(self):
         """ Call underlying summary method
         """
-        self._model.summary()
+        self.model.summary()
 
     def Dense(self, x, units, activation=None, use_bias=True, **hyperparameters):
         """ Construct Dense Layer
@@ -735,7 +729,7 @@ class Composable(object):
     def evaluate(self, x_test, y_test):
         """ Call underlying evaluate() method
         """
-        return self._model.evaluate(x_test, y_test)
+        return self.model.evaluate(x_test, y_test)
 
     def cifar10(self, epochs=10, decay=('cosine', 0)):
         """ Train on CIFAR-10
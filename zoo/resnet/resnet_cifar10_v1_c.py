@@ -85,7 +85,7 @@ class ResNetCifarV1(Composable):
             outputs = self.classifier(outputs, n_classes)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def stem(self, inputs):
         ''' Construct the Stem Convolutional Group 
@@ -82,7 +82,7 @@ class ResNetCifarV2(Composable):
             outputs = self.classifier(outputs, n_classes)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def stem(self, inputs):
         ''' Construct the Stem Convolutional Group 
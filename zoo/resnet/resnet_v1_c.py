@@ -85,7 +85,7 @@ class ResNetV1(Composable):
             outputs = self.classifier(outputs, n_classes, dropout=0.0)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
         
     def stem(self, inputs):
         """ Construct the Stem Convolutional Group 
@@ -18,7 +18,7 @@
 import tensorflow as tf
 from tensorflow.keras import Model, Input
 from tensorflow.keras.layers import Conv2D, MaxPooling2D, BatchNormalization, ReLU, Dense, Add
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Reshape, Multiply, Lambda, Concatenate
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Reshape, Multiply, Concatenate
 
 def stem(inputs):
     """ Construct the Stem Convolution Group
@@ -111,15 +111,17 @@ def identity_block(x, filters_in, filters_out, cardinality=32, ratio=16):
     x = ReLU()(x)
 
     # Cardinality (Wide) Layer (split-transform)
-    filters_card = filters_in // cardinality
-    groups = []
-    for i in range(cardinality):
-        group = Lambda(lambda z: z[:, :, :, i * filters_card:i * filters_card + filters_card])(x)
-        groups.append(Conv2D(filters_card, kernel_size=(3, 3), strides=(1, 1), padding='same',use_bias=False,
-                             kernel_initializer='he_normal')(group))
-
-    # Concatenate the outputs of the cardinality layer together (merge)
-    x = Concatenate()(groups)
+    # A single group is a plain convolution: there is nothing to split and merge
+    if cardinality == 1:
+        x = Conv2D(filters_in, kernel_size=(3, 3), strides=(1, 1), padding='same', use_bias=False,
+                   kernel_initializer='he_normal')(x)
+    else:
+        filters_card = filters_in // cardinality
+        groups = [ Conv2D(filters_card, kernel_size=(3, 3), strides=(1, 1), padding='same', use_bias=False,
+                          kernel_initializer='he_normal')(group) for group in tf.split(x, cardinality, axis=-1) ]
+
+        # Concatenate the outputs of the cardinality layer together (merge)
+        x = Concatenate()(groups)
     x = BatchNormalization()(x)
     x = ReLU()(x)
 
@@ -159,15 +161,17 @@ def projection_block(x, filters_in, filters_out, cardinality=32, strides=1, rati
     x = ReLU()(x)
 
     # Cardinality (Wide) Layer (split-transform)
-    filters_card = filters_in // cardinality
-    groups = []
-    for i in range(cardinality):
-        group = Lambda(lambda z: z[:, :, :, i * filters_card:i * filters_card + filters_card])(x)
-        groups.append(Conv2D(filters_card, kernel_size=(3, 3), strides=strides, padding='same', use_bias=False,
-                             kernel_initializer='he_normal')(group))
-
-    # Concatenate the outputs of the cardinality layer together (merge)
-    x = Concatenate()(groups)
+    # A single group is a plain convolution: there is nothing to split and merge
+    if cardinality == 1:
+        x = Conv2D(filters_in, kernel_size=(3, 3), strides=strides, padding='same', use_bias=False,
+                   kernel_initializer='he_normal')(x)
+    else:
+        filters_card = filters_in // cardinality
+        groups = [ Conv2D(filters_card, kernel_size=(3, 3), strides=strides, padding='same', use_bias=False,
+                          kernel_initializer='he_normal')(group) for group in tf.split(x, cardinality, axis=-1) ]
+
+        # Concatenate the outputs of the cardinality layer together (merge)
+        x = Concatenate()(groups)
     x = BatchNormalization()(x)
     x = ReLU()(x)
 
@@ -17,10 +17,17 @@
 # Paper: https://arxiv.org/pdf/1709.01507.pdf
 
 import tensorflow as tf
+import numpy as np
+import warnings
+import tempfile
+import shutil
+from functools import partial
 from tensorflow.keras import Model, Input
-from tensorflow.keras.layers import Conv2D, MaxPooling2D, BatchNormalization, ReLU, Dense, Add, Activation
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Reshape, Multiply, Lambda, Concatenate
+from tensorflow.keras import layers
+from tensorflow.keras.layers import Conv2D, MaxPooling2D, BatchNormalization, ReLU, Dense, Activation
+from tensorflow.keras.layers import Dense, GlobalAveragePooling2D
 from tensorflow.keras.regularizers import l2
+from tensorflow.keras.optimizers import Adam
 
 import sys
 sys.path.append('../')
@@ -45,7 +52,8 @@ class SEResNeXt(Composable):
 
     def __init__(self, n_layers, cardinality=32, ratio=16, 
                  input_shape=(224, 224, 3), n_classes=1000, include_top=True,
-                 reg=l2(0.001), init_weights='he_normal', relu=None, bias=False):
+                 reg=l2(0.001), init_weights='he_normal', relu=None, bias=False, use_mixed_precision=True,
+                 jit_compile=True):
         """ Construct a Residual Next Convolution Neural Network
             n_layers    : number of layers
             cardinality : width of group convolution
@@ -57,9 +65,23 @@ class SEResNeXt(Composable):
             reg         : kernel regularization
             relu        : max value for ReLU
             bias        : whether to use bias with batchnorm
+            use_mixed_precision: whether to use mixed float16 precision (when a GPU is available)
+            jit_compile : whether to compile the model with XLA when compiled for training
         """
         # Configure base (super) class
         super().__init__(init_weights=init_weights, reg=reg, relu=relu, bias=bias)
+        self.jit_compile = jit_compile
+
+        # Keyword arguments shared by every convolution, resolved once instead of per layer
+        # The initializer is left as an identifier, since Keras reuses the values of a shared initializer instance
+        # The data format is explicitly channels last (NHWC), which Tensor Cores require, regardless of the global default
+        self._conv_kw = { 'padding': 'same', 'data_format': 'channels_last', 'use_bias': self.bias,
+                          'kernel_initializer': self.init_weights, 'kernel_regularizer': self.reg }
+        # The squeeze-excite head is not followed by batchnorm, and never uses a bias
+        self._se_kw = dict(self._conv_kw, use_bias=False)
+
+        # Float16 compute (and float32 variables) on channels last runs the convolutions on Tensor Cores
+        self.mixed_precision = use_mixed_precision and len(tf.config.list_physical_devices('GPU')) > 0
         
         # predefined
         if isinstance(n_layers, int):
@@ -70,31 +92,49 @@ class SEResNeXt(Composable):
         else:
             groups = n_layers
 
-        # The input tensor
-        inputs = Input(shape=input_shape)
-
-        # The Stem Group
-        x = self.stem(inputs)
-
-        # The Learner
-        outputs = self.learner(x, groups=groups, cardinality=cardinality, ratio=ratio)
-
-        # The Classifier 
-        if include_top:
-            # Add hidden dropout
-            outputs = self.classifier(outputs, n_classes, dropout=0.0)
-
-        # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        # Bottleneck width of each group: filters in, filters per cardinality group, filters out
+        bottleneck = [ (group['filters_in'], group['filters_in'] // cardinality, group['filters_out'])
+                       for group in groups ]
+        for filters_in, filters_card, _ in bottleneck:
+            if filters_in % cardinality != 0:
+                raise Exception("SE-ResNeXt: filters_in must be a multiple of cardinality")
+            # Tensor Cores are only used with mixed precision
+            if self.mixed_precision and filters_card < 8:
+                warnings.warn("SE-ResNeXt: {} filters per group (filters_in={}, cardinality={}) is less than 8, "
+                              "the group convolution will underutilize Tensor Cores".format(filters_card, filters_in, cardinality))
+
+        # The layers take the global dtype policy when they are constructed, so it is only set while
+        # building the model and then restored, leaving the policy of the process unchanged
+        policy = tf.keras.mixed_precision.global_policy()
+        tf.keras.mixed_precision.set_global_policy('mixed_float16' if self.mixed_precision else 'float32')
+        try:
+            # The input tensor
+            inputs = Input(shape=input_shape)
+
+            # The Stem Group
+            x = self.stem(inputs)
+
+            # The Learner
+            outputs = self.learner(x, groups=groups, cardinality=cardinality, ratio=ratio)
+
+            # The Classifier 
+            if include_top:
+                # Add hidden dropout
+                outputs = self.classifier(outputs, n_classes, dropout=0.0,
+                                          pooling=partial(GlobalAveragePooling2D, data_format='channels_last'))
+
+            # Instantiate the Model
+            self.model = Model(inputs, outputs)
+        finally:
+            tf.keras.mixed_precision.set_global_policy(policy)
 
     def stem(self, inputs):
         """ Construct the Stem Convolution Group
             inputs : input vector
         """
-        x = self.Conv2D(inputs, 64, (7, 7), strides=(2, 2), padding='same')
-        x = self.BatchNormalization(x)
-        x = self.ReLU(x)
-        x = MaxPooling2D((3, 3), strides=(2, 2), padding='same')(x)
+        x = Conv2D(64, (7, 7), strides=(2, 2), **self._conv_kw)(inputs)
+        x = self.BNReLU(x)
+        x = MaxPooling2D((3, 3), strides=(2, 2), padding='same', data_format='channels_last')(x)
         return x
 
     def learner(self, x, **metaparameters):
@@ -128,35 +168,31 @@ class SEResNeXt(Composable):
             x = self.identity_block(x, **metaparameters) 
         return x
 
-    def squeeze_excite_block(self, x, **metaparameters):
+    def squeeze_excite_block(self, x, filters, **metaparameters):
         """ Construct a Squeeze and Excite block
-            x     : input to the block
-            ratio : amount of filter reduction during squeeze
+            x       : input to the block
+            filters : number of filters (channels) on the input
+            ratio   : amount of filter reduction during squeeze
         """  
         ratio = metaparameters['ratio']
             
         # Remember the input
         shortcut = x
-    
-        # Get the number of filters on the input
-        filters = x.shape[-1]
 
         # Squeeze (dimensionality reduction)
-        # Do global average pooling across the filters, which will output a 1D vector
-        x = GlobalAveragePooling2D()(x)
-    
-        # Reshape into 1x1 feature maps (1x1xC)
-        x = Reshape((1, 1, filters))(x)
+        # Do global average pooling across the filters, keeping the dimensions as 1x1 feature maps (1x1xC)
+        x = GlobalAveragePooling2D(data_format='channels_last', keepdims=True)(x)
     
         # Reduce the number of filters (1x1xC/r)
-        x = self.Dense(x, filters // ratio, activation='relu', use_bias=False, **metaparameters)
+        # A 1x1 convolution on 1x1 feature maps is a Dense layer, without reshaping the pooled output
+        x = Conv2D(filters // ratio, (1, 1), activation='relu', **self._se_kw)(x)
 
         # Excitation (dimensionality restoration)
-        # Restore the number of filters (1x1xC)
-        x = self.Dense(x, filters, activation='sigmoid', use_bias=False, **metaparameters)
+        # Restore the number of filters (1x1xC), the sigmoid gate is applied in the scale
+        x = Conv2D(filters, (1, 1), **self._se_kw)(x)
 
-        # Scale - multiply the squeeze/excitation output with the input (WxHxC)
-        x = Multiply()([shortcut, x])
+        # Scale - multiply the sigmoid of the squeeze/excitation output with the input (WxHxC)
+        x = SEResNeXt.SigmoidScale()([shortcut, x])
         return x
 
     def identity_block(self, x, **metaparameters):
@@ -174,35 +210,24 @@ class SEResNeXt(Composable):
         shortcut = x
 
         # Dimensionality Reduction
-        x = self.Conv2D(x, filters_in, kernel_size=(1, 1), strides=(1, 1), padding='same', 
-                        **metaparameters)
-        x = self.BatchNormalization(x)
-        x = self.ReLU(x)
-
-        # Cardinality (Wide) Layer (split-transform)
-        filters_card = filters_in // cardinality
-        groups = []
-        for i in range(cardinality):
-            group = Lambda(lambda z: z[:, :, :, i * filters_card:i * filters_card + filters_card])(x)
-            groups.append(self.Conv2D(group, filters_card, kernel_size=(3, 3), strides=(1, 1), padding='same', 
-                                      **metaparameters))
-
-        # Concatenate the outputs of the cardinality layer together (merge)
-        x = Concatenate()(groups)
-        x = self.BatchNormalization(x)
-        x = self.ReLU(x)
+        x = Conv2D(filters_in, kernel_size=(1, 1), strides=(1, 1), **self._conv_kw)(x)
+        x = self.BNReLU(x)
+
+        # Cardinality (Wide) Layer (split-transform-merge)
+        # A grouped convolution is equivalent to splitting the channels into cardinality groups,
+        # convolving each group separately and concatenating the outputs, as a single operation
+        x = Conv2D(filters_in, kernel_size=(3, 3), strides=(1, 1), groups=cardinality, **self._conv_kw)(x)
+        x = self.BNReLU(x)
 
         # Dimensionality restoration
-        x = self.Conv2D(x, filters_out, kernel_size=(1, 1), strides=(1, 1), padding='same', 
-                        **metaparameters)
+        x = Conv2D(filters_out, kernel_size=(1, 1), strides=(1, 1), **self._conv_kw)(x)
         x = self.BatchNormalization(x)
     
         # Pass the output through the squeeze and excitation block
-        x = self.squeeze_excite_block(x, **metaparameters)
+        x = self.squeeze_excite_block(x, filters_out, **metaparameters)
 
-        # Identity Link: Add the shortcut (input) to the output of the block
-        x = Add()([shortcut, x])
-        x = self.ReLU(x)
+        # Identity Link: Add the shortcut (input) to the output of the block, followed by ReLU
+        x = SEResNeXt.AddReLU(max_value=self.relu)([shortcut, x])
         return x
 
     def projection_block(self, x, strides=1, **metaparameters):
@@ -219,42 +244,234 @@ class SEResNeXt(Composable):
     
         # Construct the projection shortcut
         # Increase filters by 2X to match shape when added to output of block
-        shortcut = self.Conv2D(x, filters_out, kernel_size=(1, 1), strides=strides, padding='same', 
-                               **metaparameters)
+        shortcut = Conv2D(filters_out, kernel_size=(1, 1), strides=strides, **self._conv_kw)(x)
         shortcut = self.BatchNormalization(shortcut)
 
         # Dimensionality Reduction
-        x = self.Conv2D(x, filters_in, kernel_size=(1, 1), strides=(1, 1), padding='same', 
-                        **metaparameters)
-        x = self.BatchNormalization(x)
-        x = self.ReLU(x)
-
-        # Cardinality (Wide) Layer (split-transform)
-        filters_card = filters_in // cardinality
-        groups = []
-        for i in range(cardinality):
-            group = Lambda(lambda z: z[:, :, :, i * filters_card:i * filters_card + filters_card])(x)
-            groups.append(self.Conv2D(group, filters_card, kernel_size=(3, 3), strides=strides, padding='same', 
-                                      **metaparameters))
-
-        # Concatenate the outputs of the cardinality layer together (merge)
-        x = Concatenate()(groups)
-        x = self.BatchNormalization(x)
-        x = self.ReLU(x)
+        x = Conv2D(filters_in, kernel_size=(1, 1), strides=(1, 1), **self._conv_kw)(x)
+        x = self.BNReLU(x)
+
+        # Cardinality (Wide) Layer (split-transform-merge)
+        # A grouped convolution is equivalent to splitting the channels into cardinality groups,
+        # convolving each group separately and concatenating the outputs, as a single operation
+        x = Conv2D(filters_in, kernel_size=(3, 3), strides=strides, groups=cardinality, **self._conv_kw)(x)
+        x = self.BNReLU(x)
 
         # Dimensionality restoration
-        x = self.Conv2D(x, filters_out, kernel_size=(1, 1), strides=(1, 1), padding='same', 
-                        **metaparameters)
+        x = Conv2D(filters_out, kernel_size=(1, 1), strides=(1, 1), **self._conv_kw)(x)
         x = self.BatchNormalization(x)
     
         # Pass the output through the squeeze and excitation block
-        x = self.squeeze_excite_block(x, **metaparameters)
+        x = self.squeeze_excite_block(x, filters_out, **metaparameters)
+
+        # Add the projection shortcut (input) to the output of the block, followed by ReLU
+        x = SEResNeXt.AddReLU(max_value=self.relu)([shortcut, x])
+        return x
 
-        # Add the projection shortcut (input) to the output of the block
-        x = Add()([shortcut, x])
-        x = self.ReLU(x)
+    def BatchNormalization(self, x, **params):
+        """ Construct a (fused) Batch Normalization function
+            x : input to function
+        """
+        # Require the single kernel FusedBatchNormV3 (channels last), instead of falling back to unfused ops
+        x = BatchNormalization(axis=-1, epsilon=1.001e-5, fused=True, **params)(x)
+        return x
+
+    def BNReLU(self, x, **params):
+        """ Construct a (fused) Batch Normalization function with a ReLU activation, as a single layer
+            x : input to function
+        """
+        x = SEResNeXt.BatchNormReLU(max_value=self.relu, axis=-1, epsilon=1.001e-5, fused=True, **params)(x)
         return x
 
+    class BatchNormReLU(layers.BatchNormalization):
+        """ Custom Layer for Batch Normalization followed by ReLU activation """
+        def __init__(self, max_value=None, **parameters):
+            """ Constructor """
+            super(SEResNeXt.BatchNormReLU, self).__init__(**parameters)
+            self.max_value = max_value
+
+        def call(self, inputs, training=None):
+            """ Handler for run-time invocation of layer """
+            # The FusedBatchNormV3 -> Relu pair is rewritten by grappler into a single _FusedBatchNormEx kernel
+            x = super(SEResNeXt.BatchNormReLU, self).call(inputs, training=training)
+            return tf.keras.activations.relu(x, max_value=self.max_value)
+
+        def get_config(self):
+            """ Configuration for (de)serialization of layer """
+            config = super(SEResNeXt.BatchNormReLU, self).get_config()
+            config['max_value'] = self.max_value
+            return config
+
+    class AddReLU(layers.Layer):
+        """ Custom Layer for the residual Add followed by ReLU activation, as a single elementwise operation """
+        def __init__(self, max_value=None, **parameters):
+            """ Constructor """
+            super(SEResNeXt.AddReLU, self).__init__(**parameters)
+            self.max_value = max_value
+
+        def call(self, inputs):
+            """ Handler for run-time invocation of layer
+                inputs : the shortcut and the output of the block
+            """
+            return tf.keras.activations.relu(inputs[0] + inputs[1], max_value=self.max_value)
+
+        def get_config(self):
+            """ Configuration for (de)serialization of layer """
+            config = super(SEResNeXt.AddReLU, self).get_config()
+            config['max_value'] = self.max_value
+            return config
+
+    class SigmoidScale(layers.Layer):
+        """ Custom Layer for scaling the input by a sigmoid gate, as a single elementwise operation """
+        def call(self, inputs):
+            """ Handler for run-time invocation of layer
+                inputs : the feature maps (WxHxC) and the pre-activation gate (1x1xC)
+            """
+            return inputs[0] * tf.math.sigmoid(inputs[1])
+
+    def compile(self, loss='categorical_crossentropy', optimizer=None, metrics=['acc']):
+        """ Compile the model for training (with XLA if jit_compile)
+            loss     : the loss function
+            optimizer: the optimizer (default: Adam)
+            metrics  : metrics to report
+        """
+        if optimizer is None:
+            optimizer = Adam(lr=0.001, decay=1e-5)
+
+        # XLA fuses the elementwise tail of each block (BN, ReLU, SE scaling, Add) into a few kernels
+        self.model.compile(loss=loss, optimizer=optimizer, metrics=metrics, jit_compile=self.jit_compile)
+
+    ###
+    # Inference
+    ###
+
+    @classmethod
+    def fold_bn_for_inference(cls, model):
+        """ Fold each BatchNormalization into the preceding Conv2D for inference
+            model : the (trained) model to fold
+
+            Returns a new model where the BatchNormalization's scale and shift are baked
+            into the convolution's kernel and (synthesized) bias. A ReLU fused with the BN
+            becomes the convolution's activation (conv + bias + ReLU in a single kernel).
+        """
+        # Map each layer to the layers it consumes and is consumed by, from the functional graph config
+        graph = model.get_config()
+        producers = {}
+        consumers = {}
+        for config in graph['layers']:
+            producers[config['name']] = [inbound[0] for node in config['inbound_nodes'] for inbound in node]
+            for name in producers[config['name']]:
+                consumers.setdefault(name, []).append(config['name'])
+        outputs = set([output[0] for output in graph['output_layers']])
+
+        # Find the Conv2D -> BatchNormalization pairs, where the convolution is only consumed by the BN
+        # Subclasses (e.g., DepthwiseConv2D, Conv2DTranspose) don't have the output channels as the kernel's last axis
+        folds = {}
+        for layer in model.layers:
+            if not isinstance(layer, BatchNormalization) or len(producers[layer.name]) != 1:
+                continue
+            conv = model.get_layer(producers[layer.name][0])
+            if type(conv) is Conv2D and consumers[conv.name] == [layer.name] and conv.name not in outputs \
+               and conv.activation.__name__ == 'linear':
+                folds[conv.name] = layer
+        bns = set([bn.name for bn in folds.values()])
+
+        def clone(layer):
+            """ Replace a folded Conv2D with a biased Conv2D, and a folded BN with its activation (if any) """
+            config = layer.get_config()
+            if layer.name in folds:
+                bn = folds[layer.name]
+                config['use_bias'] = True
+                if isinstance(bn, cls.BatchNormReLU) and bn.max_value is None:
+                    config['activation'] = 'relu'
+                return layer.__class__.from_config(config)
+            if layer.name in bns:
+                # A clipped ReLU can't be expressed as the convolution's activation, it keeps the BN's dtype policy
+                if isinstance(layer, cls.BatchNormReLU) and layer.max_value is not None:
+                    return ReLU(layer.max_value, name=layer.name, dtype=layer.dtype_policy)
+                # Keep the BN's dtype policy, otherwise a mixed precision model casts to float32 and back
+                # (also when the fused ReLU moved into the convolution, leaving only the identity)
+                return Activation('linear', name=layer.name, dtype=layer.dtype_policy)
+            return layer.__class__.from_config(config)
+
+        folded = tf.keras.models.clone_model(model, clone_function=clone)
+
+        # Copy over the weights, folding the BN statistics into the convolutions
+        for layer in model.layers:
+            if layer.name in bns:
+                continue
+            weights = layer.get_weights()
+            if layer.name in folds:
+                bn = folds[layer.name]
+                n_filters = weights[0].shape[-1]
+                gamma = bn.gamma.numpy() if bn.scale  else np.ones(n_filters)
+                beta  = bn.beta.numpy()  if bn.center else np.zeros(n_filters)
+                mean  = bn.moving_mean.numpy()
+                var   = bn.moving_variance.numpy()
+                bias  = weights[1] if layer.use_bias else np.zeros(n_filters)
+
+                # W' = W * gamma / sqrt(var + eps), b' = (b - mean) * gamma / sqrt(var + eps) + beta
+                scale = gamma / np.sqrt(var + bn.epsilon)
+                weights = [weights[0] * scale, (bias - mean) * scale + beta]
+            folded.get_layer(layer.name).set_weights(weights)
+        return folded
+
+    @classmethod
+    def strip_regularizers_for_inference(cls, model):
+        """ Remove the kernel regularizers, which only contribute to the training loss
+            model : the (trained) model to strip
+
+            Returns a new model without the regularization subgraphs, with the same weights.
+        """
+        def clone(layer):
+            """ Rebuild the layer without its kernel regularizer """
+            config = layer.get_config()
+            if 'kernel_regularizer' in config:
+                config['kernel_regularizer'] = None
+            return layer.__class__.from_config(config)
+
+        # The regularization losses are attached when the layers are built, so the model is rebuilt
+        stripped = tf.keras.models.clone_model(model, clone_function=clone)
+        stripped.set_weights(model.get_weights())
+        return stripped
+
+    def to_tensorrt(self, output_dir, precision='int8', calibration_dataset=None, model=None):
+        """ Convert the model with TensorRT (TF-TRT) and save it as a SavedModel for inference
+            output_dir          : directory to save the converted model
+            precision           : precision mode ('fp32', 'fp16' or 'int8')
+            calibration_dataset : batches of input images to calibrate the int8 ranges
+            model               : model to convert, e.g., after folding/stripping (default: self.model)
+        """
+        if model is None:
+            model = self.model
+
+        precision = precision.upper()
+        if precision not in ['FP32', 'FP16', 'INT8']:
+            raise Exception("SE-ResNeXt: Invalid value for precision")
+        if precision == 'INT8' and calibration_dataset is None:
+            raise Exception("SE-ResNeXt: int8 precision requires a calibration dataset")
+
+        # TF-TRT converts from a SavedModel
+        saved_model_dir = tempfile.mkdtemp()
+        try:
+            model.save(saved_model_dir, save_format='tf')
+
+            params = tf.experimental.tensorrt.ConversionParams(precision_mode=precision)
+            converter = tf.experimental.tensorrt.Converter(input_saved_model_dir=saved_model_dir,
+                                                           conversion_params=params)
+
+            if precision == 'INT8':
+                def calibration_input_fn():
+                    """ Feed the calibration batches to the converter """
+                    for x in calibration_dataset:
+                        yield (tf.cast(x, tf.float32),)
+                converter.convert(calibration_input_fn=calibration_input_fn)
+            else:
+                converter.convert()
+            converter.save(output_dir)
+        finally:
+            shutil.rmtree(saved_model_dir)
+
 # Example
 senet = SEResNeXt(50)
 
@@ -266,8 +483,36 @@ def example():
                { 'filters_in': 256,  'filters_out' : 512,  'n_blocks': 2 },
                { 'filters_in': 512,  'filters_out' : 1024, 'n_blocks': 2 } ]
     senet = SEResNeXt(groups, input_shape=(32, 32, 3), n_classes=10)
-    senet.model.compile(loss='sparse_categorical_crossentropy', optimizer='adam', metrics=['acc'])
+    senet.compile(loss='sparse_categorical_crossentropy', optimizer='adam', metrics=['acc'])
     senet.model.summary()
     senet.cifar10()
 
 # example()
+
+def example_fold():
+    ''' Example for folding the BatchNormalization layers of a SE-ResNeXt model for inference
+    '''
+    # Example of constructing a mini-SE-ResNeXt
+    groups = [ { 'filters_in': 128,  'filters_out' : 256,  'n_blocks': 1 },
+               { 'filters_in': 256,  'filters_out' : 512,  'n_blocks': 2 } ]
+
+    # Fold the fused ReLU into the convolution (relu=None), and keep a clipped ReLU as a layer (relu=6.0)
+    for relu in [None, 6.0]:
+        senet = SEResNeXt(groups, input_shape=(32, 32, 3), include_top=False, relu=relu)
+
+        # Give the BN layers non-trivial statistics, as if trained
+        for layer in senet.model.layers:
+            if isinstance(layer, BatchNormalization):
+                n_filters = layer.gamma.shape[-1]
+                layer.set_weights([np.random.uniform(0.5, 1.5, n_filters), np.random.uniform(-0.1, 0.1, n_filters),
+                                   np.random.uniform(-0.1, 0.1, n_filters), np.random.uniform(0.5, 1.5, n_filters)])
+
+        folded = SEResNeXt.fold_bn_for_inference(senet.model)
+
+        # The folded model computes the same outputs (within float16 precision under mixed precision)
+        x = np.random.rand(8, 32, 32, 3).astype(np.float32)
+        tolerance = 1e-2 if senet.mixed_precision else 1e-4
+        print("*** Folded outputs match (relu={}):".format(relu),
+              np.allclose(senet.model.predict(x), folded.predict(x), rtol=tolerance, atol=tolerance))
+
+# example_fold()
@@ -80,7 +80,7 @@ class ShuffleNet(Composable):
             # Add hidden dropout to classifier
             outputs = self.classifier(outputs, n_classes, dropout=0.0)
 
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def stem(self, inputs):
         ''' Construct the Stem Convolution Group 
@@ -77,7 +77,7 @@ class SiameseTwin(Composable):
     
 	# Create the Siamese Network model
 	# Connect the left and right inputs to the outputs
-        self._model = Model(inputs=[left_input,right_input],outputs=outputs)
+        self.model = Model(inputs=[left_input,right_input],outputs=outputs)
 
     def twin(self, input_shape):
         ''' Construct the model for both twins of the Siamese (connected) Network
@@ -66,7 +66,7 @@ class SqueezeNet(Composable):
             outputs = self.classifier(outputs, n_classes)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
         
     def stem(self, inputs):
         ''' Construct the Stem Group  
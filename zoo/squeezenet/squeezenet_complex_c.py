@@ -64,7 +64,7 @@ class SqueezeNetComplex(Composable):
         if include_top:
             outputs = self.classifier(outputs, n_classes)
 
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
         
     def stem(self, inputs):
         ''' Construct the Stem Group
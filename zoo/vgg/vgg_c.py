@@ -79,7 +79,7 @@ class VGG(Composable):
             outputs = self.classifier(outputs, n_classes)
 
         # Instantiate the Model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def stem(self, inputs):
         """ Construct the Stem Convolutional Group
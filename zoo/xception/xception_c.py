@@ -68,7 +68,7 @@ class Xception(Composable):
         outputs = self.exitFlow(x, n_classes, include_top)
 
 	# Instantiate the model
-        self._model = Model(inputs, outputs)
+        self.model = Model(inputs, outputs)
 
     def entryFlow(self, inputs, init_weights=None, **metaparameters):
         """ Create the entry flow section